@@ -35,9 +35,11 @@ class BaseAgent():
         model_name: str = "claude-3-5-sonnet",
         log_file: str = "base_coder_agent.log",
         max_iterations: int = 5,
-        simple_prompt: bool = False
+        simple_prompt: bool = False,
+        cache_path: str = None
     ):
         self.simple_prompt = simple_prompt
+        self.cache_path = cache_path
         self.logfile = log_file
         # logger.add(log_file, format="{time} {level} {message}", level="INFO")
         self.logger = DVLogger(f"{model_name}_{uuid.uuid4()}", log_file)
@@ -94,7 +96,8 @@ class BaseAgent():
             llm=self.llm,
             handlers=[self.file_handler, self.stdout_handler],
             max_iterations=self.max_iterations,
-            simple_template=self.simple_prompt
+            simple_template=self.simple_prompt,
+            cache_path=self.cache_path
         )
 
     def get_model(
@@ -5,11 +5,15 @@ from langchain.tools import BaseTool
 from langchain.chains.llm import LLMChain
 from langchain_experimental.tools.python.tool import PythonAstREPLTool
 from langchain.schema import AgentAction, AgentFinish
-from pydantic import Field
+from langchain_community.cache import SQLiteCache
+from pydantic import PrivateAttr, model_validator
 from typing import List, Union
 import contextlib
+import contextvars
 import io
 import logging
+import os
+import pandas as pd
 import re
 
 
@@ -19,6 +23,31 @@ logging.basicConfig(level=logging.INFO)
 # set the maximum number of python code blocks that can be run
 MAX_TURNS = 1
 
+# the observation is fed back into the prompt, so cap how much of the captured output is returned
+MAX_OBS_CHARS = 8192
+# dataframes printed by the executed code are abbreviated to this many rows plus their shape
+MAX_OBS_DATAFRAME_ROWS = 20
+
+# pandas options set only while the agent's code runs
+_EXEC_PD_OPTIONS = ["display.max_rows", MAX_OBS_DATAFRAME_ROWS, "display.min_rows", MAX_OBS_DATAFRAME_ROWS]
+# copy-on-write lets the executed code work on dataframes without defensive copies; the option
+# exists from pandas 1.5 and is always on (and deprecated) from 3.0
+if (1, 5) <= tuple(int(part) for part in pd.__version__.split(".")[:2]) < (3, 0):
+    _EXEC_PD_OPTIONS += ["mode.copy_on_write", True]
+
+# regexes used on every agent turn, compiled once at import
+_FINAL_ANSWER = "Final Answer:"
+# _ANSWER_RE and _ACTION_RE are only run from an anchor located with str.find, not over the whole LLM output
+_ANSWER_RE = re.compile(r"\s*(\S+)")
+_ACTION_RE = re.compile(r"Action\s*\d*\s*:(.*?)\nAction\s*\d*\s*Input\s*\d*\s*:[\s]*(.*)", re.DOTALL)
+_CODE_BLOCK_RE = re.compile(r"```(.*?)```", re.DOTALL)
+# peels an optional leading/trailing """ and a leading "python" tag off the code
+_FENCE_RE = re.compile(r'\A\s*(?:"""\s*)?(?:python\s*)?(.*?)\s*(?:"""\s*)?\Z', re.DOTALL)
+
+# accepted final answers
+_TRUE_ANSWERS = frozenset({"true", "yes", "y"})
+_VALID_ANSWERS = _TRUE_ANSWERS | {"false", "no", "n"}
+
 template = """{system_prompt}
 
 You have access to the following tools:
@@ -38,6 +67,8 @@ Please make sure the Final Answer is either True or False. Also generate a summa
 
 IMPORTANT: all datasets have already been loaded into the global namespace as Pandas dataframes. You may access the data by referring to the EXACT dataframe names as provided in the "Datasets:" section.
 
+The following compiled statistical helpers are also available in the global namespace and are much faster than hand-written loops: perm_test_mean_diff(a, b, n_iter=10000, seed=None) returns the two-sided permutation test p-value for the difference in means of a and b, bootstrap_ci(x, n_iter=10000, alpha=0.05, seed=None) returns the (low, high) bootstrap confidence interval for the mean of x, and corr_pearson(x, y) returns the Pearson correlation of x and y. Always pass a fixed seed (e.g. seed=42) to perm_test_mean_diff and bootstrap_ci so the results are reproducible; np.random.seed does not affect them.
+
 NOTE: You will be able to execute the python code ONLY ONCE. So you will need to generate the complete code to solve the query in one go. Please provide the final answer after that. 
 
 Begin!
@@ -65,6 +96,8 @@ Please make sure the Final Answer is either True or False. Also generate a summa
 
 IMPORTANT: all datasets have already been loaded into the global namespace as Pandas dataframes. You may access the data by referring to the EXACT dataframe names as provided in the "Datasets:" section.
 
+The following compiled statistical helpers are also available in the global namespace and are much faster than hand-written loops: perm_test_mean_diff(a, b, n_iter=10000, seed=None) returns the two-sided permutation test p-value for the difference in means of a and b, bootstrap_ci(x, n_iter=10000, alpha=0.05, seed=None) returns the (low, high) bootstrap confidence interval for the mean of x, and corr_pearson(x, y) returns the Pearson correlation of x and y. Always pass a fixed seed (e.g. seed=42) to perm_test_mean_diff and bootstrap_ci so the results are reproducible; np.random.seed does not affect them.
+
 NOTE: You will be able to execute the python code ONLY ONCE. So you will need to generate the complete code to solve the query in one go. Please provide the final answer after that. 
 
 Begin!
@@ -73,9 +106,62 @@ Begin!
 {agent_scratchpad}"""
 
 
-def load_data_to_coder_globals(data_loader):
-    for name, df in data_loader.table_dict.items():
-            globals()[name] = df
+# namespace the agent's code is executed in; reused across calls instead of
+# copying this module's globals on every turn
+_EXEC_NS = {"__builtins__": __builtins__, "pd": pd}
+
+
+def load_data_to_coder_globals(data_loader, ns=_EXEC_NS):
+    ns.update(data_loader.table_dict)
+
+
+def load_stats_helpers_to_coder_globals(ns=_EXEC_NS):
+    # imported here so numba is only loaded once a coder agent is created, not by
+    # every script that imports this module
+    from baseline_agents import fast_stats
+    ns.update({name: getattr(fast_stats, name) for name in fast_stats.__all__})
+
+
+def truncate_observation(output, max_chars=MAX_OBS_CHARS):
+    if len(output) <= max_chars:
+        return output
+    half = max_chars // 2
+    return f"{output[:half]}\n... [truncated {len(output) - 2 * half} chars] ...\n{output[-half:]}"
+
+
+# output buffer of the code currently being executed, if any
+_output_buffer = contextvars.ContextVar("_output_buffer", default=None)
+
+
+class _OutputBufferHandler(logging.Handler):
+    """Writes log records emitted by the executed code into its output buffer."""
+
+    def emit(self, record):
+        buffer = _output_buffer.get()
+        if buffer is None:
+            return
+        try:
+            buffer.write(self.format(record) + "\n")
+        except Exception:
+            self.handleError(record)
+
+
+_output_buffer_handler = _OutputBufferHandler()
+_output_buffer_handler.setFormatter(logging.Formatter(logging.BASIC_FORMAT))
+logging.getLogger().addHandler(_output_buffer_handler)
+
+
+# one cache (and sqlite connection) per database file, shared by all agents using it
+_llm_caches = {}
+
+
+def get_llm_cache(database_path: str) -> SQLiteCache:
+    # exact-match cache keyed on the rendered prompt and the LLM parameters, so a different
+    # template, system prompt or model never returns a stale response
+    key = os.path.abspath(database_path)
+    if key not in _llm_caches:
+        _llm_caches[key] = SQLiteCache(database_path=database_path)
+    return _llm_caches[key]
 
 
 # Set up a prompt template
@@ -84,39 +170,57 @@ class CustomPromptTemplate(StringPromptTemplate):
     template: str
     # The list of tools available
     tools: List[BaseTool]
+    # template with tools and tool_names already filled in, the tool list is fixed for the agent's lifetime
+    _specialized_template: str = PrivateAttr("")
+
+    @model_validator(mode="after")
+    def _specialize_template(self):
+        def escape(text):
+            return text.replace("{", "{{").replace("}", "}}")
+
+        tools_block = "\n".join([f"{tool.name}: {tool.description}" for tool in self.tools])
+        tool_names = ", ".join([tool.name for tool in self.tools])
+        self._specialized_template = (
+            self.template
+            .replace("{tools}", escape(tools_block))
+            .replace("{tool_names}", escape(tool_names))
+        )
+        return self
 
     def format(self, **kwargs) -> str:
         # Get the intermediate steps (AgentAction, Observation tuples)
         # Format them in a particular way
         intermediate_steps = kwargs.pop("intermediate_steps")
-        thoughts = ""
+        parts = []
         for action, observation in intermediate_steps:
-            thoughts += action.log
-            thoughts += f"\nObservation: {observation}\nThought: "
-        # Set the agent_scratchpad variable to that value
-        kwargs["agent_scratchpad"] = thoughts
-        # Create a tools variable from the list of tools provided
-        kwargs["tools"] = "\n".join([f"{tool.name}: {tool.description}" for tool in self.tools])
-        # Create a list of tool names for the tools provided
-        kwargs["tool_names"] = ", ".join([tool.name for tool in self.tools])
-        return self.template.format(**kwargs)
+            parts.append(action.log)
+            parts.append(f"\nObservation: {observation}\nThought: ")
+        thoughts = "".join(parts)
+        # Only the per-call variables are left to fill in
+        return self._specialized_template.format(
+            system_prompt=kwargs["system_prompt"],
+            input=kwargs["input"],
+            agent_scratchpad=thoughts
+        )
 
 
 # CustomOutputParser to parse the output of the LLM and execute actions
 class CustomOutputParser(AgentOutputParser):
     def parse(self, llm_output: str) -> Union[AgentAction, AgentFinish]:
-        # Check if agent should finish
-        if "Final Answer:" in llm_output:
-            output = llm_output.split("Final Answer:")[-1].split()[0].strip().lower()
-            if output not in ["true", "false", "yes", "no", "y", "n"]:
+        # Check if agent should finish, using the token after the last "Final Answer:"
+        idx = llm_output.rfind(_FINAL_ANSWER)
+        answer = _ANSWER_RE.match(llm_output, idx + len(_FINAL_ANSWER)) if idx >= 0 else None
+        if answer:
+            output = answer.group(1).lower()
+            if output not in _VALID_ANSWERS:
                 raise ValueError(f"Could not parse LLM output: `{llm_output}`")
             return AgentFinish(
-                return_values={"output": output in ["true", "yes", 'y']},
+                return_values={"output": output in _TRUE_ANSWERS},
                 log=llm_output,
             )
-        # Parse out the action and action input
-        regex = r"Action\s*\d*\s*:(.*?)\nAction\s*\d*\s*Input\s*\d*\s*:[\s]*(.*)"
-        match = re.search(regex, llm_output, re.DOTALL)
+        # Parse out the action and action input, starting at the first "Action"
+        idx = llm_output.find("Action")
+        match = _ACTION_RE.search(llm_output, idx) if idx >= 0 else None
         if not match:
             raise ValueError(f"Could not parse LLM output: `{llm_output}`")
         action = match.group(1).strip()
@@ -126,42 +230,39 @@ class CustomOutputParser(AgentOutputParser):
 
 
 class CustomPythonAstREPLTool(PythonAstREPLTool):
-    max_turns: int = Field(0, exclude=True)
+    # number of code blocks run so far; private, so it is not one of the tool's fields and is not serialized
+    _turns: int = PrivateAttr(0)
     
     def _run(self, query: str, run_manager=None):
-        if self.max_turns >= MAX_TURNS:
+        if self._turns >= MAX_TURNS:
             return 'You cannot run the code more than once - you have already run it earlier. Please provide the "Final Answer:" immediately after "Thought:", based on whatever information you got till now. Do not attempt to output an "Action:" or run the code again.'
-        self.max_turns += 1
+        self._turns += 1
         
-        code_match = re.search(r"```(.*?)```", query, re.DOTALL)
+        code_match = _CODE_BLOCK_RE.search(query)
         if code_match:
             # Extract code within backticks
             code = code_match.group(1)
         else:
             code = query
-        code = code.strip()
-        if code.startswith('"""'):
-            code = code[3:].lstrip()
-        if code.endswith('"""'):
-            code = code[:-3].rstrip()
-        if code.startswith("python"):
-            code = code[len("python"):].lstrip()
-        
-        code = "import pandas as pd\n" + code
+        code = _FENCE_RE.match(code).group(1)
         
-        exec_globals = globals().copy()
-        exec_globals.update(__builtins__)
+        # fresh globals per run so names bound by the code do not leak into later runs;
+        # _EXEC_NS already carries __builtins__ so nothing else needs merging in
+        exec_globals = dict(_EXEC_NS)
         
         output_capture = io.StringIO()
-        with contextlib.redirect_stdout(output_capture), contextlib.redirect_stderr(output_capture):
-            logging.getLogger().handlers[0].stream = output_capture
+        token = _output_buffer.set(output_capture)
+        with contextlib.redirect_stdout(output_capture), contextlib.redirect_stderr(output_capture), \
+                pd.option_context(*_EXEC_PD_OPTIONS):
             try:
                 exec(code, exec_globals)
             except Exception as e:
                 return str(e)
+            finally:
+                _output_buffer.reset(token)
         
         # Retrieve the output and return it
-        output = output_capture.getvalue()
+        output = truncate_observation(output_capture.getvalue())
         return output if output else "Execution completed without output."
 
 def create_agent(
@@ -169,12 +270,18 @@ def create_agent(
     handlers,
     max_iterations = None,
     early_stopping_method: str = "force",
-    simple_template = False
+    simple_template = False,
+    cache_path: str = None
 ):
+    if cache_path is not None:
+        # cache LLM responses on a copy so the caller's model is left untouched
+        llm = llm.model_copy(update={"cache": get_llm_cache(cache_path)})
+
+    load_stats_helpers_to_coder_globals()
+
     output_parser = CustomOutputParser()
     python_tool = CustomPythonAstREPLTool(callbacks=handlers)
     tools = [python_tool]
-    tool_names = [tool.name for tool in tools]
 
     if simple_template:
         use_template = template_v2
@@ -193,8 +300,7 @@ def create_agent(
     agent = LLMSingleActionAgent(
         llm_chain=llm_chain,
         output_parser=output_parser,
-        stop=["\nObservation:"],
-        allowed_tools=tool_names
+        stop=["\nObservation:"]
     )
 
     return AgentExecutor.from_agent_and_tools(
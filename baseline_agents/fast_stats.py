@@ -0,0 +1,97 @@
+# Numba-compiled statistical primitives exposed to the coder agent's code
+import numba
+import numpy as np
+
+
+# The kernels draw from Numba's own RNG, which np.random.seed outside compiled
+# code does not affect, so seeding happens inside them. They run on a single
+# thread so that a given seed always produces the same result.
+
+@numba.njit(cache=True, fastmath=True)
+def _perm_test_mean_diff(a, b, n_iter, seed):
+    if seed >= 0:
+        np.random.seed(seed)
+    pooled = np.concatenate((a, b))
+    n_a = a.shape[0]
+    observed = abs(a.mean() - b.mean())
+    exceed = 0
+    for _ in range(n_iter):
+        shuffled = np.random.permutation(pooled)
+        if abs(shuffled[:n_a].mean() - shuffled[n_a:].mean()) >= observed:
+            exceed += 1
+    return (exceed + 1) / (n_iter + 1)
+
+
+@numba.njit(cache=True, fastmath=True)
+def _bootstrap_ci(x, n_iter, alpha, seed):
+    if seed >= 0:
+        np.random.seed(seed)
+    n = x.shape[0]
+    means = np.empty(n_iter)
+    for i in range(n_iter):
+        means[i] = x[np.random.randint(0, n, n)].mean()
+    means.sort()
+    lo = means[int((alpha / 2) * (n_iter - 1))]
+    hi = means[int((1 - alpha / 2) * (n_iter - 1))]
+    return lo, hi
+
+
+@numba.njit(cache=True, fastmath=True)
+def _corr_pearson(x, y):
+    dx = x - x.mean()
+    dy = y - y.mean()
+    return (dx * dy).sum() / np.sqrt((dx * dx).sum() * (dy * dy).sum())
+
+
+def _as_float_array(x, name):
+    x = np.asarray(x, dtype=np.float64)
+    x = x[~np.isnan(x)]
+    if x.shape[0] == 0:
+        raise ValueError(f"{name} has no non-NaN values")
+    return x
+
+
+def _as_seed(seed):
+    return -1 if seed is None else int(seed)
+
+
+def _check_n_iter(n_iter):
+    # the kernels do no bounds checking, so an empty resample array would read uninitialized memory
+    if n_iter < 1:
+        raise ValueError(f"n_iter must be at least 1, got {n_iter}")
+
+
+def perm_test_mean_diff(a, b, n_iter=10000, seed=None):
+    """Two-sided permutation test p-value for the difference in means of a and b."""
+    _check_n_iter(n_iter)
+    return _perm_test_mean_diff(_as_float_array(a, "a"), _as_float_array(b, "b"), n_iter, _as_seed(seed))
+
+
+def bootstrap_ci(x, n_iter=10000, alpha=0.05, seed=None):
+    """Percentile bootstrap (1 - alpha) confidence interval for the mean of x."""
+    _check_n_iter(n_iter)
+    if not 0 < alpha < 1:
+        raise ValueError(f"alpha must be between 0 and 1, got {alpha}")
+    return _bootstrap_ci(_as_float_array(x, "x"), n_iter, alpha, _as_seed(seed))
+
+
+def corr_pearson(x, y):
+    """Pearson correlation of x and y over the pairs where both are not NaN.
+
+    Returns nan when either side is constant, like np.corrcoef and scipy.stats.pearsonr.
+    """
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    if x.shape != y.shape:
+        raise ValueError(f"x and y must have the same length, got {x.shape[0]} and {y.shape[0]}")
+    mask = ~(np.isnan(x) | np.isnan(y))
+    if not mask.any():
+        raise ValueError("x and y have no pairs where both are non-NaN")
+    x, y = x[mask], y[mask]
+    # zero variance would divide by zero inside the kernel
+    if np.ptp(x) == 0 or np.ptp(y) == 0:
+        return np.nan
+    return _corr_pearson(x, y)
+
+
+__all__ = ["perm_test_mean_diff", "bootstrap_ci", "corr_pearson"]
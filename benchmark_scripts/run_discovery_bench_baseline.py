@@ -26,6 +26,7 @@ argparser.add_argument('--starts_from', type=int, default=0)
 argparser.add_argument("--log_file", type=str, default=".logs/baseline_log.log")
 argparser.add_argument('--permute', action='store_true', default=False)
 argparser.add_argument('--path', type=str, required = True)
+argparser.add_argument('--llm_cache', type=str, default=None)
 
 args = argparser.parse_args()
 
@@ -57,7 +58,8 @@ for i, example in tqdm(enumerate(bm.get_iterator()), total=samples, desc="Proces
             model_name=args.model_name,
             api_config="baseline_agents/config/api_config.json",
             model_config="baseline_agents/config/model_config.json",
-            log_file=args.log_file
+            log_file=args.log_file,
+            cache_path=args.llm_cache
         )
     elif args.agent_type == 'react':
         agent = ReactAgent(
@@ -35,6 +35,7 @@ argparser.add_argument("--dataset", type=str, default="IL2")
 argparser.add_argument('--seed', type=int, default=-1)
 argparser.add_argument('--use_simple_template', action='store_true', default=False)
 argparser.add_argument('--path', type=str, required = True)
+argparser.add_argument('--llm_cache', type=str, default=None)
 
 args = argparser.parse_args()
 
@@ -82,7 +83,8 @@ for i, example in tqdm(enumerate(bm.get_iterator()), total=samples, desc="Proces
             api_config="baseline_agents/config/api_config.json",
             model_config="baseline_agents/config/model_config.json",
             log_file=args.log_file,
-            simple_prompt=args.use_simple_template
+            simple_prompt=args.use_simple_template,
+            cache_path=args.llm_cache
         )
     elif args.agent_type == 'react':
         agent = ReactAgent(